@@ -0,0 +1,210 @@
+"""
+Persistent analysis cache. Search results are stored in an SQLite file keyed by position hash and search
+parameters, so a position analysed once is answered without searching by every later process.
+
+The database runs in WAL mode, so any number of worker processes can read it while one of them writes. Each
+process must open its own AnalysisCache (connections cannot be shared between processes). SQLite errors such as
+"database is locked" after the timeout are never fatal: a failed lookup is a miss and a failed write is dropped
+or retried with the next flush.
+"""
+import sqlite3
+import time
+
+from chess import chess_ai
+from chess import notation
+
+DEFAULT_MAX_ENTRIES = 1000000
+EVICTION_INTERVAL = 1000  # stores between checks of the cache size
+FLUSH_INTERVAL = 1000  # lookups between writes of the hit/miss counters and last used times
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis (
+    position_hash INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    best_move TEXT,
+    score INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (position_hash, params)
+);
+CREATE INDEX IF NOT EXISTS analysis_last_used ON analysis (last_used);
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _signed(position_hash):
+    # SQLite integers are signed 64-bit
+    return position_hash - (1 << 64) if position_hash >= (1 << 63) else position_hash
+
+
+class AnalysisCache:
+    """
+    Cache of (best move, score, depth) per position. A lookup only hits if the stored result was searched at
+    least as deep as requested. Least recently used entries are evicted beyond max_entries.
+    """
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, timeout=30.0):
+        self.path = path
+        self.max_entries = max_entries
+        # Autocommit mode, write transactions are opened explicitly with BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self._unflushed_hits = 0
+        self._unflushed_misses = 0
+        self._touched = {}  # (position hash, params) -> last used time not yet written
+        self._stores_since_eviction = 0
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup(self, position_hash, depth, params=""):
+        """
+        Returns (best move in coordinate notation, score, depth) if the position was searched at depth or deeper,
+        otherwise None.
+        """
+        key = (_signed(position_hash), params)
+        try:
+            row = self.connection.execute(
+                "SELECT best_move, score, depth FROM analysis WHERE position_hash = ? AND params = ? AND depth >= ?",
+                key + (depth,)).fetchone()
+        except sqlite3.Error:
+            row = None
+        if row is None:
+            self.misses += 1
+            self._unflushed_misses += 1
+        else:
+            self.hits += 1
+            self._unflushed_hits += 1
+            self._touched[key] = time.time()
+        if self._unflushed_hits + self._unflushed_misses >= FLUSH_INTERVAL:
+            self.flush()
+        return row
+
+    def store(self, position_hash, best_move, score, depth, params=""):
+        """
+        Stores a search result unless a deeper one is already cached. If SQLite fails the result is not cached.
+        """
+        try:
+            self.connection.execute(
+                "INSERT INTO analysis (position_hash, params, best_move, score, depth, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (position_hash, params) DO UPDATE SET best_move = excluded.best_move, "
+                "score = excluded.score, depth = excluded.depth, last_used = excluded.last_used "
+                "WHERE excluded.depth >= analysis.depth",
+                (_signed(position_hash), params, best_move, score, depth, time.time()))
+        except sqlite3.Error:
+            return
+        self._stores_since_eviction += 1
+        if self._stores_since_eviction >= EVICTION_INTERVAL:
+            self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used entries above max_entries.
+        """
+        self._stores_since_eviction = 0
+
+        def delete_excess():
+            excess = self.connection.execute("SELECT COUNT(*) FROM analysis").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM analysis WHERE rowid IN (SELECT rowid FROM analysis ORDER BY last_used LIMIT ?)",
+                    (excess,))
+        self._transaction(delete_excess)
+
+    def flush(self):
+        """
+        Writes the last used times of the entries hit since the previous flush and adds this process's hit/miss
+        counts to the totals shared by all processes, all in one transaction. If SQLite fails they are kept for
+        the next flush.
+        """
+        if not self._unflushed_hits and not self._unflushed_misses and not self._touched:
+            return
+
+        def write():
+            self.connection.executemany("UPDATE analysis SET last_used = ? WHERE position_hash = ? AND params = ?",
+                                        [(used,) + key for key, used in self._touched.items()])
+            for name, value in (("hits", self._unflushed_hits), ("misses", self._unflushed_misses)):
+                self.connection.execute("INSERT INTO metrics (name, value) VALUES (?, ?) "
+                                        "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                                        (name, value))
+        if self._transaction(write):
+            self._unflushed_hits = self._unflushed_misses = 0
+            self._touched.clear()
+
+    def _transaction(self, work):
+        """
+        Calls work() inside a write transaction. Returns False instead of raising if SQLite fails.
+        """
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                work()
+                self.connection.execute("COMMIT")
+            except BaseException:
+                if self.connection.in_transaction:
+                    self.connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            return False
+        return True
+
+    def stats(self):
+        """
+        Returns the hit/miss counts and hit rate of this process and of all processes together.
+        """
+        self.flush()
+        totals = dict(self.connection.execute("SELECT name, value FROM metrics").fetchall())
+        total_hits, total_misses = totals.get("hits", 0), totals.get("misses", 0)
+        return {
+            "entries": self.connection.execute("SELECT COUNT(*) FROM analysis").fetchone()[0],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+            "total_hits": total_hits,
+            "total_misses": total_misses,
+            "total_hit_rate": total_hits / (total_hits + total_misses) if total_hits + total_misses else 0.0,
+        }
+
+
+def find_best_move(cache, gs, valid_moves, depth=chess_ai.SEARCH_DEPTH, params=None):
+    """
+    Same as chess_ai.find_best_move, but answers from the cache when it can and stores new results.
+    Sets chess_ai.best_score, chess_ai.nodes_searched (0 on a hit) and chess_ai.root_depth like a search would.
+    params defaults to chess_ai.search_params(), so results of another evaluation or set of tablebases are not
+    reused.
+    """
+    if params is None:
+        params = chess_ai.search_params()
+    position_hash = gs.zobrist_key
+    cached = cache.lookup(position_hash, depth, params)
+    if cached is not None:
+        best_move, score, cached_depth = cached
+        try:
+            move = notation.parse_coordinate_move(best_move, valid_moves) if best_move else None
+        except ValueError:
+            move = cached = None  # a hash collision with another position, search instead
+    if cached is not None:
+        chess_ai.next_move = move
+        chess_ai.best_score = score
+        chess_ai.nodes_searched = 0
+        chess_ai.root_depth = cached_depth
+        return move
+
+    move = chess_ai.find_best_move(gs, valid_moves, depth)
+    cache.store(position_hash, move.get_chess_notation() if move is not None else None,
+                chess_ai.best_score, depth, params)
+    return move
@@ -0,0 +1,196 @@
+"""
+Streaming batch analysis. Reads positions as JSON lines, analyses them on a pool of worker processes and writes
+one JSON line per position with the best move, score, depth, nodes and time.
+
+Each input line is an object with an optional "id", either a "fen" or a list of coordinate-notation "moves"
+played from the start position (a space separated string is accepted too), and an optional "depth":
+
+    {"id": "puzzle-1", "fen": "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", "depth": 2}
+    {"id": "game-7", "moves": ["e2e4", "e7e5", "g1f3"]}
+
+Scores are from White's perspective, like chess_ai.score_board. A line that cannot be analysed produces
+{"id": ..., "error": ...} instead of stopping the run; so does a depth above --max-depth, since search time grows
+about twentyfold per ply.
+
+With --cache, results are looked up in and added to a persistent analysis cache shared by all workers.
+
+Usage: python -m chess.batch_analysis [input.jsonl] [-o output.jsonl] [--workers N] [--unordered] [--cache FILE]
+                                     [--depth N] [--max-depth N]
+"""
+import argparse
+import collections
+import concurrent.futures
+import json
+import multiprocessing.util
+import os
+import sys
+import time
+
+from chess import analysis_cache
+from chess import chess_ai
+from chess import notation
+
+IN_FLIGHT_PER_WORKER = 4  # Default bound on queued positions per worker process
+MAX_DEPTH = 4  # Default bound on the depth a line may ask for
+
+_caches = {}  # path -> AnalysisCache opened by this process
+
+
+def analyse_position(gs, depth=chess_ai.SEARCH_DEPTH, cache=None, time_limit=None):
+    """
+    Searches gs and returns a dict with the best move in coordinate notation, score, depth, nodes and time.
+    With a cache, a result cached at depth or deeper is returned with its own depth and 0 nodes. With a
+    time_limit (seconds) the search deepens iteratively up to depth and "depth" is the deepest one that finished
+    in time; the cache is not used then.
+    """
+    start = time.perf_counter()
+    valid_moves = gs.get_valid_moves()
+    if time_limit is not None:
+        best_move = chess_ai.find_best_move_within(gs, valid_moves, depth, time_limit)
+    elif cache is None:
+        best_move = chess_ai.find_best_move(gs, valid_moves, depth)
+    else:
+        best_move = analysis_cache.find_best_move(cache, gs, valid_moves, depth)
+    if best_move is None and valid_moves:
+        # Every move scored as badly as possible (e.g. all lose to mate), any of them is "best"
+        best_move = valid_moves[0]
+    return {
+        "best_move": best_move.get_chess_notation() if best_move is not None else None,
+        "score": chess_ai.best_score,
+        "depth": chess_ai.root_depth,
+        "nodes": chess_ai.nodes_searched,
+        "time": round(time.perf_counter() - start, 6),
+    }
+
+
+def get_cache(path):
+    """
+    Returns this process's AnalysisCache for path, opening it on first use.
+    """
+    if path not in _caches:
+        _caches[path] = analysis_cache.AnalysisCache(path)
+        # Worker processes skip atexit handlers, this makes sure the hit/miss counters get written
+        multiprocessing.util.Finalize(_caches[path], _caches[path].close, exitpriority=10)
+    return _caches[path]
+
+
+def analyse_line(line_number, line, default_depth=chess_ai.SEARCH_DEPTH, cache_path=None, max_depth=MAX_DEPTH):
+    """
+    Worker entry point: analyses one raw JSONL input line and returns the output record.
+    Parsing happens here so the reading process only moves strings around.
+    """
+    position_id = line_number
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("Each line must be a JSON object")
+        position_id = request.get("id", line_number)
+        depth = int(request.get("depth", default_depth))
+        if not 1 <= depth <= max_depth:
+            raise ValueError("depth must be between 1 and %d" % max_depth)
+        if "fen" not in request and "moves" not in request:
+            raise ValueError("Each line needs a 'fen' or 'moves' field")
+        gs = notation.replay_moves(request.get("moves", []), request.get("fen", notation.START_FEN))
+        result = analyse_position(gs, depth, get_cache(cache_path) if cache_path else None)
+    except Exception as error:
+        # A bad line must never stop the stream, whatever it breaks
+        return {"id": position_id, "error": str(error) or type(error).__name__}
+    result["id"] = position_id
+    return result
+
+
+def analyse_stream(lines, workers=None, max_in_flight=None, ordered=True, depth=chess_ai.SEARCH_DEPTH,
+                   cache_path=None, max_depth=MAX_DEPTH):
+    """
+    Generator yielding one result dict per non-blank input line.
+
+    At most max_in_flight lines are submitted to the pool at any time and the next line is only read once a
+    result has been handed to the caller, so memory use does not grow with the size of the input.
+    With ordered=True results come out in input order, otherwise as soon as they complete.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * IN_FLIGHT_PER_WORKER
+    numbered_lines = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit_next():
+            for number, line in numbered_lines:
+                return executor.submit(analyse_line, number, line, depth, cache_path, max_depth)
+            return None
+
+        if ordered:
+            pending = collections.deque()
+            while True:
+                while len(pending) < max_in_flight:
+                    future = submit_next()
+                    if future is None:
+                        break
+                    pending.append(future)
+                if not pending:
+                    return
+                yield pending.popleft().result()
+        else:
+            pending = set()
+            while True:
+                while len(pending) < max_in_flight:
+                    future = submit_next()
+                    if future is None:
+                        break
+                    pending.add(future)
+                if not pending:
+                    return
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse positions from a JSONL stream.")
+    parser.add_argument("input", nargs="?", default="-", help="input JSONL file, '-' for stdin")
+    parser.add_argument("-o", "--output", default="-", help="output JSONL file, '-' for stdout")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="positions queued at once (default: %d per worker)" % IN_FLIGHT_PER_WORKER)
+    parser.add_argument("--depth", type=int, default=chess_ai.SEARCH_DEPTH, help="default search depth")
+    parser.add_argument("--max-depth", type=int, default=MAX_DEPTH,
+                        help="deepest search a line may ask for (default: %d)" % MAX_DEPTH)
+    parser.add_argument("--unordered", action="store_true", help="write results as they complete")
+    parser.add_argument("--cache", default=None, help="persistent analysis cache file (SQLite)")
+    args = parser.parse_args(argv)
+    if not 1 <= args.depth <= args.max_depth:
+        parser.error("--depth must be between 1 and --max-depth")
+
+    before = None
+    if args.cache:
+        with analysis_cache.AnalysisCache(args.cache) as cache:
+            before = cache.stats()
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for result in analyse_stream(source, args.workers, args.max_in_flight, not args.unordered, args.depth,
+                                     args.cache, args.max_depth):
+            sink.write(json.dumps(result) + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    if before is not None:
+        print_cache_stats(args.cache, before)
+
+
+def print_cache_stats(path, before):
+    """
+    Writes the hit rate of this run (the workers' counters added since before) and of all runs to stderr.
+    """
+    with analysis_cache.AnalysisCache(path) as cache:
+        after = cache.stats()
+    hits = after["total_hits"] - before["total_hits"]
+    misses = after["total_misses"] - before["total_misses"]
+    print("cache: %d hits, %d misses (%.1f%%) this run; %d hits, %d misses (%.1f%%) in total; %d entries" % (
+        hits, misses, 100.0 * hits / (hits + misses) if hits + misses else 0.0, after["total_hits"],
+        after["total_misses"], 100.0 * after["total_hit_rate"], after["entries"]), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
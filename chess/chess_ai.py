@@ -1,12 +1,21 @@
 import random
+import time
+
+from chess import tablebase
 
 
 PIECE_SCORE = {"K": 0, "Q": 900, "R": 500, "B": 330, "N": 320, "P": 100, "--": 0}
 CHECKMATE = 10000000  # A very large number
 STALEMATE = 0
 SEARCH_DEPTH = 3  # You can adjust this for search depth
+EVALUATION_VERSION = 1  # Increase whenever scoring changes, so cached analysis of the old scoring is not reused
 
 next_move = None
+best_score = 0  # Score of next_move, from White's perspective
+nodes_searched = 0  # Positions visited by the last search
+root_depth = SEARCH_DEPTH  # Depth the last search was started with
+deadline = None  # time.perf_counter() value at which the running search is abandoned, None for no limit
+DEPTH_TIME_GROWTH = 20  # A search one ply deeper takes about this many times longer
 
 # Pawns are usually valued more in the center and closer to promotion
 PAWN_SCORES = [
@@ -123,30 +132,133 @@ def score_board(gs):
     return score
 
 
-def find_best_move(gs, valid_moves):
+def search_params():
+    """
+    Describes everything besides position and depth that decides a search result: the evaluation version and
+    the loaded tablebases. Used to key cached analysis.
+    """
+    return "eval=%d;tablebases=%s" % (EVALUATION_VERSION, ",".join(tablebase.loaded_materials()))
+
+
+def find_best_move(gs, valid_moves, depth=SEARCH_DEPTH):
     """
     Top-level function to start the search and return the best move.
+    After the search best_score and nodes_searched describe the result.
     """
-    global next_move
+    global next_move, best_score, nodes_searched, root_depth
     next_move = None
+    nodes_searched = 0
+    root_depth = depth
+
+    # Endgames covered by a tablebase are played perfectly without searching
+    if find_tablebase_move(gs, valid_moves):
+        return next_move
 
     # Initiate the Minimax search with initial alpha/beta boundaries
-    find_minimax_move(gs, valid_moves, SEARCH_DEPTH, -CHECKMATE, CHECKMATE, gs.white_to_move)
+    best_score = find_minimax_move(gs, valid_moves, depth, -CHECKMATE, CHECKMATE, gs.white_to_move)
     return next_move
 
 
+class SearchTimeout(Exception):
+    """
+    Raised out of a search when the deadline has passed.
+    """
+
+
+def find_best_move_within(gs, valid_moves, max_depth, time_limit):
+    """
+    Iterative deepening: searches at depth 1, 2, ... up to max_depth and returns the best move of the deepest
+    search that finished within time_limit seconds. A depth that is not expected to finish in the time left is
+    not started and one still running at the deadline is abandoned. Depth 1 always runs, so there is a move.
+    Afterwards best_score and root_depth describe the returned move and nodes_searched counts every iteration.
+    """
+    global next_move, best_score, nodes_searched, root_depth, deadline
+    start = time.perf_counter()
+    ply = len(gs.move_log)
+    result = (find_best_move(gs, valid_moves, 1), best_score, 1)
+    total_nodes = nodes_searched
+    last_iteration_time = time.perf_counter() - start
+    for depth in range(2, max_depth + 1):
+        iteration_start = time.perf_counter()
+        if last_iteration_time * DEPTH_TIME_GROWTH > start + time_limit - iteration_start:
+            break
+        deadline = start + time_limit
+        try:
+            move = find_best_move(gs, valid_moves, depth)
+        except SearchTimeout:
+            total_nodes += nodes_searched
+            while len(gs.move_log) > ply:
+                gs.undo_move()
+            gs.get_valid_moves()  # clears checkmate/stalemate flags left by the abandoned line
+            break
+        finally:
+            deadline = None
+        total_nodes += nodes_searched
+        result = (move, best_score, depth)
+        last_iteration_time = time.perf_counter() - iteration_start
+    next_move, best_score, root_depth = result
+    nodes_searched = total_nodes
+    return next_move
+
+
+def tablebase_score(gs):
+    """
+    Exact score of the position from the tablebases (White's perspective), or None if no table covers it.
+    A faster mate scores higher than a slower one.
+    """
+    value = tablebase.probe(gs)
+    if value is None:
+        return None
+    if value == 0:
+        return STALEMATE
+    plies = value - 1
+    score = CHECKMATE - plies if plies % 2 == 1 else -(CHECKMATE - plies)  # for the side to move
+    return score if gs.white_to_move else -score
+
+
+def find_tablebase_move(gs, valid_moves):
+    """
+    Sets next_move and best_score from the tablebases if the position and all its successors are covered.
+    Returns False if the normal search is needed.
+    """
+    global next_move, best_score
+    if not valid_moves or tablebase_score(gs) is None:
+        return False
+    sign = 1 if gs.white_to_move else -1
+    best_move = None
+    for move in valid_moves:
+        gs.make_move(move)
+        score = tablebase_score(gs)
+        gs.undo_move()
+        if score is None:
+            return False
+        if best_move is None or score * sign > best_score * sign:
+            best_move, best_score = move, score
+    next_move = best_move
+    return True
+
+
 def find_minimax_move(gs, valid_moves, depth, alpha, beta, white_to_move):
     """
     The recursive minimax implementation with Alpha-Beta Pruning (Part 13).
     The function always returns the score from the perspective of the maximizing player (White).
     """
-    global next_move
+    global next_move, nodes_searched
+    nodes_searched += 1
+    if deadline is not None and time.perf_counter() > deadline:
+        raise SearchTimeout()
 
     # Base case: When depth is 0 or game is over
     if depth == 0 or gs.checkmate or gs.stalemate:
         # The score_board already returns the material score from White's perspective (positive=good for white)
         return score_board(gs)
 
+    # Below the root a tablebase hit is exact, no need to search further
+    if depth != root_depth:
+        score = tablebase_score(gs)
+        if score is not None:
+            return score
+
     if white_to_move:  # Maximizing player (White)
         max_score = -CHECKMATE
         for move in valid_moves:
@@ -159,7 +271,7 @@ def find_minimax_move(gs, valid_moves, depth, alpha, beta, white_to_move):
 
             if score > max_score:
                 max_score = score
-                if depth == SEARCH_DEPTH:  # Only update the global move at the top search level
+                if depth == root_depth:  # Only update the global move at the top search level
                     next_move = move
 
             # Alpha Pruning
@@ -180,7 +292,7 @@ def find_minimax_move(gs, valid_moves, depth, alpha, beta, white_to_move):
 
             if score < min_score:
                 min_score = score
-                if depth == SEARCH_DEPTH:  # Only update the global move at the top search level
+                if depth == root_depth:  # Only update the global move at the top search level
                     next_move = move
 
             # Beta Pruning
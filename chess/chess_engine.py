@@ -2,10 +2,39 @@
 This class responsible for storing all the information about the current state of a chess game. It also will be
 responsible for determining the valid moves at the current state. It will also log all the moves.
 """
+from array import array
+
+from chess import zobrist
 
 LEFT_SIDE_OF_BOARD = 0
 RIGHT_SIDE_OF_BOARD = 7
 
+# Castling rights are kept as bits of one integer
+WHITE_KING_SIDE = 1
+WHITE_QUEEN_SIDE = 2
+BLACK_KING_SIDE = 4
+BLACK_QUEEN_SIDE = 8
+ALL_CASTLING_RIGHTS = 15
+# Castling right -> the king and rook it needs on their home squares
+CASTLING_HOME_SQUARES = {
+    WHITE_KING_SIDE: ("wK", (7, 4), "wR", (7, 7)),
+    WHITE_QUEEN_SIDE: ("wK", (7, 4), "wR", (7, 0)),
+    BLACK_KING_SIDE: ("bK", (0, 4), "bR", (0, 7)),
+    BLACK_QUEEN_SIDE: ("bK", (0, 4), "bR", (0, 0)),
+}
+
+# Undo stack: every ply stores the irreversible state from before the move, packed into one integer, and the hash
+MAX_PLY = 1024  # plies preallocated, the stack doubles if a game gets longer
+UNDO_SLOTS = 2  # packed state, hash
+NO_EN_PASSANT = 64  # en passant square value meaning "none"
+EN_PASSANT_SHIFT = 4  # bits 0-3: castling rights, 4-10: en passant square
+CAPTURED_SHIFT = 11  # bits 11-14: captured piece
+HALFMOVE_SHIFT = 15  # bits 15 and up: halfmove clock
+MAX_HALFMOVE_CLOCK = 65535  # largest clock accepted from outside, leaves room to count up within the 64 bits
+PIECE_CODES = ["--", "wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK"]
+PIECE_TO_CODE = {piece: code for code, piece in enumerate(PIECE_CODES)}
+SQUARES = [(row, column) for row in range(8) for column in range(8)] + [()]  # square index -> en passant tuple
+
 
 class GameState:
     def __init__(self):
@@ -24,10 +53,10 @@ class GameState:
         self.white_to_move = True
         self.move_log = []
         self.en_passant_possible = ()
-        self.current_castling_rights = CastleRights(True, True, True, True)
-        # Log to track rights history of moves
-        self.castle_rights_log = [CastleRights(self.current_castling_rights.wks, self.current_castling_rights.wqs,
-                                               self.current_castling_rights.bks, self.current_castling_rights.bqs)]
+        self.castling_rights = ALL_CASTLING_RIGHTS
+        self.halfmove_clock = 0  # plies since the last capture or pawn move
+        # Irreversible state of every ply in move_log, restored exactly by undo_move
+        self.undo_stack = array('Q', bytes(8 * UNDO_SLOTS * MAX_PLY))
 
         self.move_functions = {'P': self.get_pawn_moves, 'R': self.get_rook_moves, 'N': self.get_knight_moves,
                                'B': self.get_bishop_moves, 'Q': self.get_queen_moves, 'K': self.get_king_moves}
@@ -36,8 +65,66 @@ class GameState:
         self.in_check_flag = False
         self.checkmate = False
         self.stalemate = False
+        self.zobrist_key = zobrist.hash_position(self)
+
+    @property
+    def current_castling_rights(self):
+        return CastleRights(bool(self.castling_rights & WHITE_KING_SIDE), bool(self.castling_rights & WHITE_QUEEN_SIDE),
+                            bool(self.castling_rights & BLACK_KING_SIDE), bool(self.castling_rights & BLACK_QUEEN_SIDE))
+
+    @current_castling_rights.setter
+    def current_castling_rights(self, rights):
+        self.castling_rights = (WHITE_KING_SIDE if rights.wks else 0) | (WHITE_QUEEN_SIDE if rights.wqs else 0) | \
+                               (BLACK_KING_SIDE if rights.bks else 0) | (BLACK_QUEEN_SIDE if rights.bqs else 0)
+
+    def set_position(self, board, white_to_move, castling_rights=0, en_passant_possible=(), halfmove_clock=0):
+        """
+        Replaces the current position, e.g. one read from a FEN string. The move history is cleared.
+        Castling rights whose king or rook is not on its home square are dropped.
+        """
+        for right, (king, king_square, rook, rook_square) in CASTLING_HOME_SQUARES.items():
+            if board[king_square[0]][king_square[1]] != king or board[rook_square[0]][rook_square[1]] != rook:
+                castling_rights &= ~right
+        self.board = board
+        self.white_to_move = white_to_move
+        self.castling_rights = castling_rights
+        self.en_passant_possible = en_passant_possible
+        self.halfmove_clock = halfmove_clock
+        self.move_log = []
+        for row in range(8):
+            for column in range(8):
+                if board[row][column] == "wK":
+                    self.white_king_location = (row, column)
+                elif board[row][column] == "bK":
+                    self.black_king_location = (row, column)
+        self.checkmate = False
+        self.stalemate = False
+        self.zobrist_key = zobrist.hash_position(self)
 
     def make_move(self, move):
+        # Save the irreversible state first, indexed by the ply of this move
+        slot = len(self.move_log) * UNDO_SLOTS
+        if slot == len(self.undo_stack):
+            self.undo_stack.extend(self.undo_stack)  # double the stack, the old contents get overwritten as we go
+        en_passant_square = NO_EN_PASSANT if self.en_passant_possible == () else \
+            self.en_passant_possible[0] * 8 + self.en_passant_possible[1]
+        self.undo_stack[slot] = self.castling_rights | (en_passant_square << EN_PASSANT_SHIFT) | \
+            (PIECE_TO_CODE[move.piece_captured] << CAPTURED_SHIFT) | (self.halfmove_clock << HALFMOVE_SHIFT)
+        self.undo_stack[slot + 1] = self.zobrist_key
+
+        key = self.zobrist_key ^ zobrist.BLACK_TO_MOVE_KEY ^ \
+            zobrist.PIECE_SQUARE_KEYS[move.piece_moved][move.start_row * 8 + move.start_column]
+        if move.piece_captured != "--":
+            captured_row = move.start_row if move.is_en_passant_move else move.end_row
+            key ^= zobrist.PIECE_SQUARE_KEYS[move.piece_captured][captured_row * 8 + move.end_column]
+        key ^= zobrist.en_passant_key(self.board, self.en_passant_possible, self.white_to_move)
+        key ^= zobrist.CASTLING_RIGHTS_KEYS[self.castling_rights]
+
+        if move.piece_moved[1] == 'P' or move.piece_captured != "--":
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+
         self.board[move.start_row][move.start_column] = "--"
         self.board[move.end_row][move.end_column] = move.piece_moved
 
@@ -57,23 +144,29 @@ class GameState:
         # Update en_passant_possible
         if move.piece_moved[1] == 'P' and abs(move.start_row - move.end_row) == 2:
             # Pawn moved two squares, set the square behind it as possible
-            self.en_passant_possible = ((move.start_row + move.end_row) // 2, move.start_column)
+            self.en_passant_possible = SQUARES[(move.start_row + move.end_row) // 2 * 8 + move.start_column]
         else:
             self.en_passant_possible = ()
 
         if move.is_castle_move:
+            rook = self.board[move.end_row][7 if move.end_column == 6 else 0]
             if move.end_column == 6:  # King-side castle (g-file)
                 self.board[move.end_row][5] = self.board[move.end_row][7]  # Move Rook to f-square
                 self.board[move.end_row][7] = "--"  # Clear old Rook square (h-square)
+                key ^= zobrist.PIECE_SQUARE_KEYS[rook][move.end_row * 8 + 7] ^ \
+                    zobrist.PIECE_SQUARE_KEYS[rook][move.end_row * 8 + 5]
             else:  # Queen-side castle (c-file)
                 self.board[move.end_row][3] = self.board[move.end_row][0]  # Move Rook to d-square
                 self.board[move.end_row][0] = "--"  # Clear old Rook square (a-square)
+                key ^= zobrist.PIECE_SQUARE_KEYS[rook][move.end_row * 8] ^ \
+                    zobrist.PIECE_SQUARE_KEYS[rook][move.end_row * 8 + 3]
 
         # Update Castling Rights based on the move
         self.update_castle_rights(move)
-        # Log the new castling rights state
-        self.castle_rights_log.append(CastleRights(self.current_castling_rights.wks, self.current_castling_rights.wqs,
-                                                   self.current_castling_rights.bks, self.current_castling_rights.bqs))
+        key ^= zobrist.CASTLING_RIGHTS_KEYS[self.castling_rights]
+        key ^= zobrist.en_passant_key(self.board, self.en_passant_possible, not self.white_to_move)
+        self.zobrist_key = key ^ zobrist.PIECE_SQUARE_KEYS[self.board[move.end_row][move.end_column]][
+            move.end_row * 8 + move.end_column]
 
         self.move_log.append(move)  # history
         self.white_to_move = not self.white_to_move  # switch
@@ -85,25 +178,23 @@ class GameState:
             # 1. Restore the piece that moved to its start square
             self.board[move.start_row][move.start_column] = move.piece_moved
 
+            # Restore the irreversible state saved by make_move
+            slot = len(self.move_log) * UNDO_SLOTS
+            state = self.undo_stack[slot]
+            self.zobrist_key = self.undo_stack[slot + 1]
+            self.castling_rights = state & ALL_CASTLING_RIGHTS
+            self.en_passant_possible = SQUARES[(state >> EN_PASSANT_SHIFT) & 127]
+            piece_captured = PIECE_CODES[(state >> CAPTURED_SHIFT) & 15]
+            self.halfmove_clock = state >> HALFMOVE_SHIFT
+
             # 2. Restore the piece that was captured (or '--' for a regular move) to the end square
-            self.board[move.end_row][move.end_column] = move.piece_captured
+            self.board[move.end_row][move.end_column] = piece_captured
 
             # 3. Handle the En Passant exception
             if move.is_en_passant_move:
                 self.board[move.end_row][move.end_column] = "--"  # Make the landing square empty
                 # Put the captured pawn back on its correct adjacent square
-                self.board[move.start_row][move.end_column] = move.piece_captured
-
-            # Undo a two-square advance (since this resets the en_passant_possible state for the next move)
-            if move.piece_moved[1] == 'P' and abs(move.start_row - move.end_row) == 2:
-                self.en_passant_possible = ()
-
-            # Undo Castling Rights: Restore the previous state from the log
-            self.castle_rights_log.pop()  # Remove the current entry
-            # Get the previous (correct) entry and set current rights
-            new_rights = self.castle_rights_log[-1]
-            self.current_castling_rights = CastleRights(new_rights.wks, new_rights.wqs,
-                                                        new_rights.bks, new_rights.bqs)
+                self.board[move.start_row][move.end_column] = piece_captured
 
             # Move the Rook back
             if move.is_castle_move:
@@ -122,9 +213,6 @@ class GameState:
 
     # moves considering checks
     def get_valid_moves(self):
-        # Save current en_passant_possible to restore it later
-        temp_en_passant_possible = self.en_passant_possible  # Create a temporary copy
-
         # Returns all moves for now
         moves = self.get_all_possible_moves()
         if not self.in_check():
@@ -146,14 +234,12 @@ class GameState:
         else:
             self.checkmate = False
             self.stalemate = False
-
-        self.en_passant_possible = temp_en_passant_possible  # Restore the value
         return moves
 
     def get_castle_moves(self, r, c, moves):
         # White Castling (Row 7)
         if self.white_to_move:
-            if self.current_castling_rights.wks:
+            if self.castling_rights & WHITE_KING_SIDE:
                 # King-side: f1 and g1 must be empty and not attacked
                 if self.board[7][5] == "--" and self.board[7][6] == "--":
                     # King cannot pass through an attacked square
@@ -161,7 +247,7 @@ class GameState:
                         # Move from e1(7, 4) to g1(7, 6)
                         moves.append(Move((r, c), (7, 6), self.board, is_castle_move=True))
 
-            if self.current_castling_rights.wqs:
+            if self.castling_rights & WHITE_QUEEN_SIDE:
                 # Queen-side: d1, c1, and b1 must be empty. d1 and c1 must not be attacked.
                 if self.board[7][3] == "--" and self.board[7][2] == "--" and self.board[7][1] == "--":
                     # King cannot pass through an attacked square
@@ -171,12 +257,12 @@ class GameState:
 
         # Black Castling (Row 0)
         else:
-            if self.current_castling_rights.bks:
+            if self.castling_rights & BLACK_KING_SIDE:
                 if self.board[0][5] == "--" and self.board[0][6] == "--":
                     if not self.square_under_attack(0, 5) and not self.square_under_attack(0, 6):
                         moves.append(Move((r, c), (0, 6), self.board, is_castle_move=True))
 
-            if self.current_castling_rights.bqs:
+            if self.castling_rights & BLACK_QUEEN_SIDE:
                 if self.board[0][3] == "--" and self.board[0][2] == "--" and self.board[0][1] == "--":
                     if not self.square_under_attack(0, 3) and not self.square_under_attack(0, 2):
                         moves.append(Move((r, c), (0, 2), self.board, is_castle_move=True))
@@ -280,39 +366,39 @@ class GameState:
     def update_castle_rights(self, move):
         # Piece moved was King
         if move.piece_moved == 'wK':
-            self.current_castling_rights.wks = False
-            self.current_castling_rights.wqs = False
+            self.castling_rights &= ~WHITE_KING_SIDE
+            self.castling_rights &= ~WHITE_QUEEN_SIDE
         elif move.piece_moved == 'bK':
-            self.current_castling_rights.bks = False
-            self.current_castling_rights.bqs = False
+            self.castling_rights &= ~BLACK_KING_SIDE
+            self.castling_rights &= ~BLACK_QUEEN_SIDE
 
         # Piece moved was Rook from a corner
         elif move.piece_moved == 'wR':
             if move.start_row == 7:
                 if move.start_column == 0:  # a1 Rook moved
-                    self.current_castling_rights.wqs = False
+                    self.castling_rights &= ~WHITE_QUEEN_SIDE
                 elif move.start_column == 7:  # h1 Rook moved
-                    self.current_castling_rights.wks = False
+                    self.castling_rights &= ~WHITE_KING_SIDE
         elif move.piece_moved == 'bR':
             if move.start_row == 0:
                 if move.start_column == 0:  # a8 Rook moved
-                    self.current_castling_rights.bqs = False
+                    self.castling_rights &= ~BLACK_QUEEN_SIDE
                 elif move.start_column == 7:  # h8 Rook moved
-                    self.current_castling_rights.bks = False
+                    self.castling_rights &= ~BLACK_KING_SIDE
 
         # Piece captured was a Rook
         if move.piece_captured == 'wR':
             if move.end_row == 7:
                 if move.end_column == 0:  # a1 Rook captured
-                    self.current_castling_rights.wqs = False
+                    self.castling_rights &= ~WHITE_QUEEN_SIDE
                 elif move.end_column == 7:  # h1 Rook captured
-                    self.current_castling_rights.wks = False
+                    self.castling_rights &= ~WHITE_KING_SIDE
         elif move.piece_captured == 'bR':
             if move.end_row == 0:
                 if move.end_column == 0:  # a8 Rook captured
-                    self.current_castling_rights.bqs = False
+                    self.castling_rights &= ~BLACK_QUEEN_SIDE
                 elif move.end_column == 7:  # h8 Rook captured
-                    self.current_castling_rights.bks = False
+                    self.castling_rights &= ~BLACK_KING_SIDE
 
     def get_king_moves(self, row, column, moves):
         king_moves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
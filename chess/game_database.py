@@ -0,0 +1,350 @@
+"""
+Compact on-disk game database built from PGN files and read through memory maps.
+
+A database is a directory with five files:
+    games.bin       one fixed size record per game: offset of its moves, offset of its headers, ply count, result
+    moves.bin       every game's moves packed into 2 bytes each (start square | end square << 6)
+    headers.jsonl   the PGN headers of every game as one JSON line
+    positions.bin   one record per position reached (Zobrist hash, game id, ply, next move) sorted by hash and game
+    move_stats.bin  one record per position and move played from it (Zobrist hash, move, games, white wins, draws,
+                    black wins) sorted by hash, aggregated from positions.bin when the database is built
+
+Looking up a position is a binary search, so "which games reach this position" (a page of game ids at a time)
+and "which moves were played from here" do not depend on the number of games, not even for the start position.
+
+Usage:
+    python -m chess.game_database build DIRECTORY games.pgn [more.pgn ...]
+    python -m chess.game_database query DIRECTORY (--fen FEN | --moves "e2e4 e7e5")
+"""
+import argparse
+import array
+import bisect
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+
+from chess import chess_engine
+from chess import notation
+from chess import pgn
+
+GAME_RECORD = struct.Struct("<QQHBx")  # moves offset, headers offset, ply count, result
+POSITION_RECORD = struct.Struct("<QIHH")  # position hash, game id, ply, next move
+MOVE_STATS_RECORD = struct.Struct("<QHxxIIII")  # position hash, move, games, white wins, draws, black wins
+HASH_FIELD = struct.Struct("<Q")
+POSITION_KEY = struct.Struct("<QI")  # position hash, game id: the sort key of POSITION_RECORD
+NO_MOVE = 0xFFFF  # next move of the final position of a game
+RESULT_CODES = {"*": 0, "1-0": 1, "0-1": 2, "1/2-1/2": 3}
+RESULT_NAMES = {v: k for k, v in RESULT_CODES.items()}
+SORT_CHUNK_RECORDS = 1000000  # positions sorted in memory at once while building the index
+
+
+def pack_move(move):
+    return (move.start_row * 8 + move.start_column) | ((move.end_row * 8 + move.end_column) << 6)
+
+
+def unpack_move(packed):
+    """
+    Returns the coordinate notation ("e2e4") of a packed move.
+    """
+    start, end = packed & 63, packed >> 6
+    return _square_name(start) + _square_name(end)
+
+
+def _square_name(square):
+    return chess_engine.Move.columns_to_files[square % 8] + chess_engine.Move.rows_to_ranks[square // 8]
+
+
+def build_database(pgn_paths, directory, chunk_records=SORT_CHUNK_RECORDS):
+    """
+    Replays every game in pgn_paths through GameState and writes the database files to directory. Games the engine
+    cannot replay (malformed FEN headers, illegal or unsupported moves) are skipped.
+    Returns (games written, games skipped).
+
+    Position records are sorted in chunks of chunk_records and merged at the end, so memory use is bounded by the
+    chunk size rather than the size of the collection.
+    """
+    os.makedirs(directory, exist_ok=True)
+    games_written = games_skipped = 0
+    moves_offset = 0
+    results = bytearray()  # result code per game id, for the move statistics
+    run_paths = []
+    chunk = []
+
+    with open(os.path.join(directory, "games.bin"), "wb") as games_file, \
+            open(os.path.join(directory, "moves.bin"), "wb") as moves_file, \
+            open(os.path.join(directory, "headers.jsonl"), "wb") as headers_file:
+        for path in pgn_paths:
+            with open(path, encoding="utf-8", errors="replace") as stream:
+                for headers, san_moves, result in pgn.read_games(stream):
+                    try:
+                        packed_moves = array.array("H")
+                        positions = []
+                        for gs, move in pgn.replay_game(headers, san_moves):
+                            packed = NO_MOVE if move is None else pack_move(move)
+                            positions.append((gs.zobrist_key, games_written, len(packed_moves), packed))
+                            if move is not None:
+                                packed_moves.append(packed)
+                    except Exception:
+                        # A malformed game (bad FEN header, illegal move, ...) must not abort the whole import
+                        games_skipped += 1
+                        continue
+
+                    headers_offset = headers_file.tell()
+                    headers_file.write(json.dumps(headers).encode("utf-8") + b"\n")
+                    if sys.byteorder != "little":
+                        packed_moves.byteswap()
+                    packed_moves.tofile(moves_file)
+                    games_file.write(GAME_RECORD.pack(moves_offset, headers_offset, len(packed_moves),
+                                                      RESULT_CODES.get(result, 0)))
+                    moves_offset += len(packed_moves)
+                    results.append(RESULT_CODES.get(result, 0))
+                    games_written += 1
+
+                    chunk.extend(positions)
+                    if len(chunk) >= chunk_records:
+                        run_paths.append(_write_sorted_run(chunk, directory, len(run_paths)))
+                        chunk = []
+
+    if chunk or not run_paths:
+        run_paths.append(_write_sorted_run(chunk, directory, len(run_paths)))
+    _merge_runs(run_paths, os.path.join(directory, "positions.bin"))
+    _write_move_stats(os.path.join(directory, "positions.bin"), results, os.path.join(directory, "move_stats.bin"))
+    return games_written, games_skipped
+
+
+def _write_sorted_run(records, directory, run_number):
+    records.sort()
+    path = os.path.join(directory, "positions.%d.run" % run_number)
+    with open(path, "wb") as run_file:
+        for record in records:
+            run_file.write(POSITION_RECORD.pack(*record))
+    return path
+
+
+def _read_run(path):
+    with open(path, "rb") as run_file:
+        while True:
+            data = run_file.read(POSITION_RECORD.size * 4096)
+            if not data:
+                return
+            yield from POSITION_RECORD.iter_unpack(data)
+
+
+def _merge_runs(run_paths, output_path):
+    if len(run_paths) == 1:
+        os.replace(run_paths[0], output_path)
+        return
+    with open(output_path, "wb") as output:
+        for record in heapq.merge(*[_read_run(path) for path in run_paths]):
+            output.write(POSITION_RECORD.pack(*record))
+    for path in run_paths:
+        os.remove(path)
+
+
+def _write_move_stats(positions_path, results, output_path):
+    """
+    Aggregates the sorted position records into one record per (position hash, move) with the number of games
+    and their results. Records are grouped by hash, so only one position's moves are held in memory at a time.
+    """
+    result_slots = {RESULT_CODES["1-0"]: 1, RESULT_CODES["1/2-1/2"]: 2, RESULT_CODES["0-1"]: 3}
+    with open(output_path, "wb") as output:
+        current_hash = None
+        moves = {}  # move -> [games, white wins, draws, black wins]
+
+        def write_position():
+            for move, entry in sorted(moves.items()):
+                output.write(MOVE_STATS_RECORD.pack(current_hash, move, *entry))
+
+        for position_hash, game_id, _, move in _read_run(positions_path):
+            if position_hash != current_hash:
+                write_position()
+                current_hash, moves = position_hash, {}
+            if move == NO_MOVE:
+                continue
+            entry = moves.setdefault(move, [0, 0, 0, 0])
+            entry[0] += 1
+            slot = result_slots.get(results[game_id])
+            if slot is not None:
+                entry[slot] += 1
+        write_position()
+
+
+class _HashColumn:
+    """
+    Read-only sequence view of the hashes in a file of records starting with the hash, so bisect can search the
+    memory map directly.
+    """
+    def __init__(self, data, record=POSITION_RECORD):
+        self.data = data
+        self.record = record
+
+    def __len__(self):
+        return len(self.data) // self.record.size
+
+    def __getitem__(self, index):
+        return HASH_FIELD.unpack_from(self.data, index * self.record.size)[0]
+
+
+class _PositionKeys(_HashColumn):
+    """
+    Read-only sequence view of the (hash, game id) pairs in positions.bin, the order the records are sorted in.
+    """
+    def __getitem__(self, index):
+        return POSITION_KEY.unpack_from(self.data, index * self.record.size)
+
+
+class GameDatabase:
+    """
+    Read access to a database written by build_database. Positions are identified by their Zobrist hash,
+    see GameState.zobrist_key.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._files = []
+        self.games = self._map("games.bin")
+        self.moves = self._map("moves.bin")
+        self.positions = self._map("positions.bin")
+        self.headers = self._map("headers.jsonl")
+        self.move_stats = self._map("move_stats.bin")
+        self._hashes = _HashColumn(self.positions)
+        self._position_keys = _PositionKeys(self.positions)
+        self._move_stats_hashes = _HashColumn(self.move_stats, MOVE_STATS_RECORD)
+
+    def _map(self, name):
+        map_file = open(os.path.join(self.directory, name), "rb")
+        self._files.append(map_file)
+        if os.fstat(map_file.fileno()).st_size == 0:
+            return b""  # an empty file cannot be memory-mapped
+        return mmap.mmap(map_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        for data in (self.games, self.moves, self.positions, self.headers, self.move_stats):
+            if isinstance(data, mmap.mmap):
+                data.close()
+        for map_file in self._files:
+            map_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.games) // GAME_RECORD.size
+
+    def _game_record(self, game_id):
+        if not 0 <= game_id < len(self):
+            raise IndexError("No game with id %d" % game_id)
+        return GAME_RECORD.unpack_from(self.games, game_id * GAME_RECORD.size)
+
+    def game_moves(self, game_id):
+        """
+        Returns the moves of a game in coordinate notation.
+        """
+        moves_offset, _, ply_count, _ = self._game_record(game_id)
+        packed = array.array("H")
+        packed.frombytes(self.moves[moves_offset * 2:(moves_offset + ply_count) * 2])
+        if sys.byteorder != "little":
+            packed.byteswap()
+        return [unpack_move(move) for move in packed]
+
+    def game_headers(self, game_id):
+        _, headers_offset, _, _ = self._game_record(game_id)
+        end = self.headers.find(b"\n", headers_offset)
+        return json.loads(self.headers[headers_offset:end])
+
+    def game_result(self, game_id):
+        return RESULT_NAMES[self._game_record(game_id)[3]]
+
+    def position_records(self, position_hash):
+        """
+        Generator over (game id, ply, next move) for every time position_hash was reached.
+        next_move is None at the end of a game.
+        """
+        index = bisect.bisect_left(self._hashes, position_hash)
+        while index < len(self._hashes):
+            record_hash, game_id, ply, next_move = POSITION_RECORD.unpack_from(self.positions,
+                                                                               index * POSITION_RECORD.size)
+            if record_hash != position_hash:
+                return
+            yield game_id, ply, None if next_move == NO_MOVE else unpack_move(next_move)
+            index += 1
+
+    def position_count(self, position_hash):
+        """
+        Returns how many times position_hash was reached, over all games.
+        """
+        return bisect.bisect_right(self._hashes, position_hash) - bisect.bisect_left(self._hashes, position_hash)
+
+    def games_reaching(self, position_hash, limit=100, after=-1):
+        """
+        Returns the ids of up to limit games reaching position_hash, in ascending order and greater than after;
+        pass the last id of a page as after to get the next one. limit=None returns all of them.
+        """
+        games = []
+        index = bisect.bisect_left(self._position_keys, (position_hash, after + 1))
+        while index < len(self._hashes) and (limit is None or len(games) < limit):
+            record_hash, game_id, _, _ = POSITION_RECORD.unpack_from(self.positions, index * POSITION_RECORD.size)
+            if record_hash != position_hash:
+                break
+            if not games or games[-1] != game_id:
+                games.append(game_id)
+            index += 1
+        return games
+
+    def move_statistics(self, position_hash):
+        """
+        Returns {move: {"games", "white_wins", "draws", "black_wins"}} for the moves played from position_hash,
+        most played first.
+        """
+        statistics = {}
+        index = bisect.bisect_left(self._move_stats_hashes, position_hash)
+        while index < len(self._move_stats_hashes):
+            record_hash, move, games, white_wins, draws, black_wins = MOVE_STATS_RECORD.unpack_from(
+                self.move_stats, index * MOVE_STATS_RECORD.size)
+            if record_hash != position_hash:
+                break
+            statistics[unpack_move(move)] = {"games": games, "white_wins": white_wins, "draws": draws,
+                                             "black_wins": black_wins}
+            index += 1
+        return dict(sorted(statistics.items(), key=lambda item: -item[1]["games"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query a PGN game database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a database from PGN files")
+    build.add_argument("directory")
+    build.add_argument("pgn_files", nargs="+")
+    query = commands.add_parser("query", help="show games and move statistics for a position")
+    query.add_argument("directory")
+    position = query.add_mutually_exclusive_group(required=True)
+    position.add_argument("--fen")
+    position.add_argument("--moves", help="coordinate notation moves from the start position")
+    query.add_argument("--limit", type=int, default=20, help="maximum number of game ids to print")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        written, skipped = build_database(args.pgn_files, args.directory)
+        print("%d games written, %d skipped" % (written, skipped))
+        return
+
+    gs = notation.game_state_from_fen(args.fen) if args.fen else notation.replay_moves(args.moves)
+    position_hash = gs.zobrist_key
+    with GameDatabase(args.directory) as database:
+        print("Position reached %d times" % database.position_count(position_hash))
+        for game_id in database.games_reaching(position_hash, args.limit):
+            headers = database.game_headers(game_id)
+            print("  #%d %s - %s %s" % (game_id, headers.get("White", "?"), headers.get("Black", "?"),
+                                        database.game_result(game_id)))
+        for move, entry in database.move_statistics(position_hash).items():
+            print("%s %d games (+%d =%d -%d)" % (move, entry["games"], entry["white_wins"], entry["draws"],
+                                                  entry["black_wins"]))
+
+
+if __name__ == '__main__':
+    main()
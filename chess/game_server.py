@@ -0,0 +1,315 @@
+"""
+Asyncio game server hosting many games at once. Clients connect over TCP or a Unix socket and send one JSON object
+per line; every request gets one JSON line back, carrying the request's "id" if it had one:
+
+    {"op": "new", "fen": "...", "budget": 60}    start a game (fen and budget are optional) -> {"game": 1, ...}
+    {"op": "move", "game": 1, "move": "e2e4"}    play a move in coordinate notation
+    {"op": "ai", "game": 1, "depth": 3}          let the engine move (depth is optional)
+    {"op": "state", "game": 1}                   position, status and move list
+    {"op": "close", "game": 1}                   end a game
+    {"op": "metrics"}                            server and engine pool metrics
+
+Engine searches run on a shared process pool, never on the event loop. Queued searches are handed out round-robin
+between connections, so a client with many games cannot starve the others. Every game has a budget of engine
+seconds, at most the server's --budget: an "ai" request deepens its search iteratively up to the requested depth
+and plays the move of the deepest search finished when the remaining budget runs out (or when the next depth is
+not expected to fit). Only the depth 1 search, which always completes, can overdraw the budget by a fraction of a
+second; once it is used up "ai" requests are refused. Games belong to the connection that created them and end
+when it disconnects.
+
+Usage: python -m chess.game_server [--host HOST] [--port PORT | --unix PATH] [--workers N] [--budget SECONDS]
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import itertools
+import json
+import logging
+import math
+import os
+import time
+
+from chess import batch_analysis
+from chess import chess_ai
+from chess import notation
+
+DEFAULT_PORT = 8765
+DEFAULT_BUDGET = 300.0  # engine seconds per game
+MAX_DEPTH = 6
+
+logger = logging.getLogger(__name__)
+
+
+def search_position(fen, depth, time_limit):
+    """
+    Worker process entry point: searches the position for at most time_limit seconds (see
+    chess_ai.find_best_move_within) and returns the batch_analysis result dict.
+    """
+    return batch_analysis.analyse_position(notation.game_state_from_fen(fen), depth, time_limit=time_limit)
+
+
+class GameSession:
+    def __init__(self, game_id, owner, gs, budget):
+        self.game_id = game_id
+        self.owner = owner
+        self.gs = gs
+        self.valid_moves = gs.get_valid_moves()
+        self.budget = budget
+        self.budget_remaining = budget
+        self.lock = asyncio.Lock()  # one request at a time per game
+
+    def status(self):
+        if self.gs.checkmate:
+            return "checkmate"
+        if self.gs.stalemate:
+            return "stalemate"
+        return "active"
+
+    def play(self, move):
+        self.gs.make_move(move)
+        self.valid_moves = self.gs.get_valid_moves()
+
+    def describe(self):
+        return {"game": self.game_id, "fen": notation.to_fen(self.gs), "status": self.status(),
+                "white_to_move": self.gs.white_to_move, "budget_remaining": round(self.budget_remaining, 3)}
+
+
+class EngineScheduler:
+    """
+    Runs searches on a process pool with at most one search per worker in flight. Waiting searches are queued
+    per owner and owners take turns.
+    """
+    def __init__(self, executor, workers):
+        self.executor = executor
+        self.workers = workers
+        self.queues = {}  # owner -> deque of (fen, depth, time limit, future, enqueued at)
+        self.owners = collections.deque()  # owners with queued searches, in turn order
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.total_search = 0.0
+
+    def queue_depth(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def submit(self, owner, fen, depth, time_limit):
+        """
+        Queues a search of at most time_limit seconds and returns a future for its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if owner not in self.queues:
+            self.queues[owner] = collections.deque()
+            self.owners.append(owner)
+        self.queues[owner].append((fen, depth, time_limit, future, time.perf_counter()))
+        self._dispatch()
+        return future
+
+    def cancel_owner(self, owner):
+        """
+        Drops the queued (not yet running) searches of owner.
+        """
+        for _, _, _, future, _ in self.queues.pop(owner, ()):
+            future.cancel()
+        if owner in self.owners:
+            self.owners.remove(owner)
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.in_flight < self.workers and self.owners:
+            owner = self.owners.popleft()
+            queue = self.queues[owner]
+            fen, depth, time_limit, future, enqueued_at = queue.popleft()
+            if queue:
+                self.owners.append(owner)  # back of the line
+            else:
+                del self.queues[owner]
+            if future.cancelled():
+                continue
+            self.in_flight += 1
+            self.total_wait += time.perf_counter() - enqueued_at
+            search = loop.run_in_executor(self.executor, search_position, fen, depth, time_limit)
+            search.add_done_callback(functools.partial(self._finished, future))
+
+    def _finished(self, future, search):
+        self.in_flight -= 1
+        if search.cancelled():
+            future.cancel()
+        elif search.exception() is not None:
+            self.failed += 1
+            if not future.cancelled():
+                future.set_exception(search.exception())
+        else:
+            self.completed += 1
+            self.total_search += search.result()["time"]
+            if not future.cancelled():
+                future.set_result(search.result())
+        self._dispatch()
+
+    def metrics(self):
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth(),
+            "queue_depth_by_client": {str(owner): len(queue) for owner, queue in self.queues.items()},
+            "completed": self.completed,
+            "failed": self.failed,
+            "average_wait": self.total_wait / (self.completed + self.failed) if self.completed + self.failed else 0.0,
+            "average_search": self.total_search / self.completed if self.completed else 0.0,
+        }
+
+
+class GameServer:
+    def __init__(self, workers=None, budget=DEFAULT_BUDGET):
+        self.workers = workers or os.cpu_count() or 1
+        self.budget = budget
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        self.scheduler = EngineScheduler(self.executor, self.workers)
+        self.sessions = {}  # game id -> GameSession
+        self.game_ids = itertools.count(1)
+        self.connection_ids = itertools.count(1)
+        self.connections = 0
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    async def handle_connection(self, reader, writer):
+        owner = next(self.connection_ids)
+        self.connections += 1
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                # Each request runs as its own task so a slow search does not hold up the connection's other games
+                task = asyncio.create_task(self.handle_line(owner, line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            self.scheduler.cancel_owner(owner)
+            for task in tasks:
+                task.cancel()
+            for game_id in [game_id for game_id, session in self.sessions.items() if session.owner == owner]:
+                del self.sessions[game_id]
+            writer.close()
+
+    async def handle_line(self, owner, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Each request must be a JSON object")
+            request_id = request.get("id")
+            response = await self.handle_request(owner, request)
+            response["ok"] = True
+        except (ValueError, TypeError, KeyError) as error:
+            response = {"ok": False, "error": str(error)}
+        except Exception as error:
+            # Not the client's fault (e.g. a crashed engine process), but it must not end the connection either
+            logger.exception("Request failed: %r", line)
+            response = {"ok": False, "error": str(error) or type(error).__name__}
+        if request_id is not None:
+            response["id"] = request_id
+        if not writer.is_closing():
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+
+    async def handle_request(self, owner, request):
+        op = request.get("op")
+        if op == "new":
+            gs = notation.game_state_from_fen(request.get("fen", notation.START_FEN))
+            budget = float(request.get("budget", self.budget))
+            if not math.isfinite(budget) or budget <= 0:
+                raise ValueError("budget must be a positive number of seconds")
+            budget = min(budget, self.budget)
+            session = GameSession(next(self.game_ids), owner, gs, budget)
+            self.sessions[session.game_id] = session
+            return session.describe()
+        if op == "metrics":
+            return self.metrics()
+
+        session = self.session(owner, request)
+        async with session.lock:
+            if op == "state":
+                response = session.describe()
+                response["moves"] = [move.get_chess_notation() for move in session.gs.move_log]
+                return response
+            if op == "move":
+                if session.status() != "active":
+                    raise ValueError("Game %d is over" % session.game_id)
+                session.play(notation.parse_coordinate_move(str(request["move"]), session.valid_moves))
+                return session.describe()
+            if op == "ai":
+                return await self.engine_move(session, int(request.get("depth", chess_ai.SEARCH_DEPTH)))
+            if op == "close":
+                del self.sessions[session.game_id]
+                return {"game": session.game_id, "closed": True}
+        raise ValueError("Unknown op: %r" % op)
+
+    def session(self, owner, request):
+        session = self.sessions.get(request.get("game"))
+        if session is None or session.owner != owner:
+            raise ValueError("No such game: %r" % request.get("game"))
+        return session
+
+    async def engine_move(self, session, depth):
+        if session.status() != "active":
+            raise ValueError("Game %d is over" % session.game_id)
+        if not 1 <= depth <= MAX_DEPTH:
+            raise ValueError("depth must be between 1 and %d" % MAX_DEPTH)
+        if session.budget_remaining <= 0:
+            raise ValueError("Game %d has used up its engine budget" % session.game_id)
+        result = await self.scheduler.submit(session.owner, notation.to_fen(session.gs), depth,
+                                             session.budget_remaining)
+        session.budget_remaining -= result["time"]
+        if session.game_id in self.sessions:  # the game may have been closed while searching
+            session.play(notation.parse_coordinate_move(result["best_move"], session.valid_moves))
+        response = session.describe()
+        response.update(move=result["best_move"], score=result["score"], depth=result["depth"],
+                        nodes=result["nodes"], time=result["time"])
+        return response
+
+    def metrics(self):
+        response = self.scheduler.metrics()
+        response.update(games=len(self.sessions), connections=self.connections)
+        return response
+
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, unix_path=None, workers=None, budget=DEFAULT_BUDGET):
+    game_server = GameServer(workers, budget)
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(game_server.handle_connection, path=unix_path)
+    else:
+        server = await asyncio.start_server(game_server.handle_connection, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        game_server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many chess games over a line/JSON protocol.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="engine processes (default: CPU count)")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="engine seconds per game")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.budget))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
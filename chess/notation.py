@@ -0,0 +1,195 @@
+"""
+Helpers for moving positions and moves in and out of text: FEN strings for positions, coordinate notation
+(e.g. "e2e4", the same format as Move.get_chess_notation) and standard algebraic notation (SAN, e.g. "Nxf3+")
+for moves.
+"""
+import re
+
+from chess import chess_engine
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# FEN piece letters: upper case is white, lower case is black
+FEN_TO_PIECE = {"P": "wP", "N": "wN", "B": "wB", "R": "wR", "Q": "wQ", "K": "wK",
+                "p": "bP", "n": "bN", "b": "bB", "r": "bR", "q": "bQ", "k": "bK"}
+PIECE_TO_FEN = {v: k for k, v in FEN_TO_PIECE.items()}
+
+
+def game_state_from_fen(fen):
+    """
+    Builds a GameState from a FEN string. Raises ValueError if the FEN is malformed or describes a position
+    the engine cannot play (missing or extra kings, pawns on the first or last rank, an en passant square without
+    the pawn that can be captured).
+    """
+    if not isinstance(fen, str):
+        raise ValueError("FEN must be a string: %r" % (fen,))
+    fields = fen.split()
+    if len(fields) < 2:
+        raise ValueError("FEN needs at least a board and a side to move: %r" % fen)
+    rows = fields[0].split("/")
+    if len(rows) != 8:
+        raise ValueError("FEN board must have 8 rows: %r" % fen)
+
+    board = []
+    white_king_location = black_king_location = None
+    for row, fen_row in enumerate(rows):
+        board_row = []
+        for char in fen_row:
+            if char.isdigit():
+                board_row.extend(["--"] * int(char))
+            elif char in FEN_TO_PIECE:
+                piece = FEN_TO_PIECE[char]
+                if piece[1] == "P" and row in (0, 7):
+                    raise ValueError("Pawns cannot stand on the first or last rank: %r" % fen)
+                if piece == "wK":
+                    if white_king_location is not None:
+                        raise ValueError("FEN must contain exactly one white king: %r" % fen)
+                    white_king_location = (row, len(board_row))
+                elif piece == "bK":
+                    if black_king_location is not None:
+                        raise ValueError("FEN must contain exactly one black king: %r" % fen)
+                    black_king_location = (row, len(board_row))
+                board_row.append(piece)
+            else:
+                raise ValueError("Unknown piece %r in FEN: %r" % (char, fen))
+            if len(board_row) > 8:
+                break
+        if len(board_row) != 8:
+            raise ValueError("FEN row %d must have 8 squares: %r" % (row + 1, fen))
+        board.append(board_row)
+    if white_king_location is None or black_king_location is None:
+        raise ValueError("FEN must contain both kings: %r" % fen)
+
+    if fields[1] not in ("w", "b"):
+        raise ValueError("Side to move must be 'w' or 'b': %r" % fen)
+
+    castling = fields[2] if len(fields) > 2 else "-"
+    castling_rights = (chess_engine.WHITE_KING_SIDE if "K" in castling else 0) | \
+                      (chess_engine.WHITE_QUEEN_SIDE if "Q" in castling else 0) | \
+                      (chess_engine.BLACK_KING_SIDE if "k" in castling else 0) | \
+                      (chess_engine.BLACK_QUEEN_SIDE if "q" in castling else 0)
+    en_passant = fields[3] if len(fields) > 3 else "-"
+    en_passant_possible = () if en_passant == "-" else square_from_notation(en_passant)
+    if en_passant_possible != ():
+        # The square a pawn just skipped: empty, on the 6th rank from the mover's side, the pawn right in front of it
+        row, column = en_passant_possible
+        pawn_row, pawn = (3, "bP") if fields[1] == "w" else (4, "wP")
+        if row != pawn_row + (-1 if fields[1] == "w" else 1) or board[row][column] != "--" or \
+                board[pawn_row][column] != pawn:
+            raise ValueError("Invalid en passant square %r: %r" % (en_passant, fen))
+    if len(fields) > 4 and (not fields[4].isdigit() or int(fields[4]) > chess_engine.MAX_HALFMOVE_CLOCK):
+        raise ValueError("Halfmove clock must be a number up to %d: %r" % (chess_engine.MAX_HALFMOVE_CLOCK, fen))
+    halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+
+    gs = chess_engine.GameState()
+    gs.set_position(board, fields[1] == "w", castling_rights, en_passant_possible, halfmove_clock)
+    return gs
+
+
+def to_fen(gs):
+    """
+    Returns the FEN string of the current position. The fullmove number is not tracked by GameState and
+    is always written as 1.
+    """
+    rows = []
+    for board_row in gs.board:
+        fen_row = ""
+        empty = 0
+        for piece in board_row:
+            if piece == "--":
+                empty += 1
+            else:
+                if empty:
+                    fen_row += str(empty)
+                    empty = 0
+                fen_row += PIECE_TO_FEN[piece]
+        if empty:
+            fen_row += str(empty)
+        rows.append(fen_row)
+
+    rights = gs.current_castling_rights
+    castling = ("K" if rights.wks else "") + ("Q" if rights.wqs else "") + \
+               ("k" if rights.bks else "") + ("q" if rights.bqs else "")
+    en_passant = "-" if gs.en_passant_possible == () else \
+        chess_engine.Move.columns_to_files[gs.en_passant_possible[1]] + \
+        chess_engine.Move.rows_to_ranks[gs.en_passant_possible[0]]
+    return "%s %s %s %s %d 1" % ("/".join(rows), "w" if gs.white_to_move else "b", castling or "-", en_passant,
+                                 gs.halfmove_clock)
+
+
+def square_from_notation(text):
+    """
+    Converts a square such as "e4" to a (row, column) tuple.
+    """
+    if len(text) != 2 or text[0] not in chess_engine.Move.files_to_columns or \
+            text[1] not in chess_engine.Move.ranks_to_rows:
+        raise ValueError("Invalid square: %r" % text)
+    return chess_engine.Move.ranks_to_rows[text[1]], chess_engine.Move.files_to_columns[text[0]]
+
+
+def parse_coordinate_move(text, valid_moves):
+    """
+    Finds the move written in coordinate notation ("e2e4", "e7e8q") among valid_moves.
+    The engine always promotes to a queen, so a promotion suffix is accepted but must be 'q'.
+    """
+    text = text.strip().lower()
+    if len(text) == 5 and text[4] == "q":
+        text = text[:4]
+    if len(text) != 4:
+        raise ValueError("Invalid move: %r" % text)
+    start_row, start_column = square_from_notation(text[:2])
+    end_row, end_column = square_from_notation(text[2:])
+    for move in valid_moves:
+        if move.start_row == start_row and move.start_column == start_column and \
+                move.end_row == end_row and move.end_column == end_column:
+            return move
+    raise ValueError("Illegal move: %r" % text)
+
+
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+
+def parse_san_move(text, gs, valid_moves):
+    """
+    Finds the move written in SAN ("e4", "Nbd7", "exd6", "O-O", "e8=Q+") among valid_moves for position gs.
+    Raises ValueError for an illegal or ambiguous move, or an under-promotion the engine cannot play.
+    """
+    san = text.rstrip("+#!?")
+    king = "wK" if gs.white_to_move else "bK"
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        end_column = 6 if len(san) == 3 else 2
+        for move in valid_moves:
+            if move.is_castle_move and move.piece_moved == king and move.end_column == end_column:
+                return move
+        raise ValueError("Illegal move: %r" % text)
+
+    match = SAN_PATTERN.match(san)
+    if match is None:
+        raise ValueError("Invalid move: %r" % text)
+    piece, from_file, from_rank, destination, promotion = match.groups()
+    if promotion is not None and promotion != "Q":
+        raise ValueError("Only promotion to a queen is supported: %r" % text)
+    piece = piece or "P"
+    end_row, end_column = square_from_notation(destination)
+    candidates = [move for move in valid_moves
+                  if move.piece_moved == king[0] + piece and move.end_row == end_row and move.end_column == end_column
+                  and (from_file is None or move.start_column == chess_engine.Move.files_to_columns[from_file])
+                  and (from_rank is None or move.start_row == chess_engine.Move.ranks_to_rows[from_rank])]
+    if len(candidates) != 1:
+        raise ValueError("%s move: %r" % ("Illegal" if not candidates else "Ambiguous", text))
+    return candidates[0]
+
+
+def replay_moves(moves, fen=START_FEN):
+    """
+    Plays a list of coordinate-notation moves (or a space separated string of them) from fen and
+    returns the resulting GameState.
+    """
+    if isinstance(moves, str):
+        moves = moves.split()
+    if not isinstance(moves, list) or not all(isinstance(text, str) for text in moves):
+        raise ValueError("moves must be a string or a list of strings")
+    gs = game_state_from_fen(fen)
+    for text in moves:
+        gs.make_move(parse_coordinate_move(text, gs.get_valid_moves()))
+    return gs
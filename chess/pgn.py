@@ -0,0 +1,91 @@
+"""
+Streaming PGN reader. Games are read one at a time from any iterable of lines (e.g. an open file), so a collection
+of any size can be processed without loading it into memory.
+"""
+import re
+
+from chess import notation
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.+")
+
+
+def read_games(lines):
+    """
+    Generator yielding (headers, san_moves, result) for every game in lines. Comments, variations, NAGs and
+    move numbers are dropped; san_moves is the list of main line moves in SAN.
+    """
+    headers = {}
+    tokens = []
+    in_movetext = False
+    comment_depth = 0  # inside {...}
+    variation_depth = 0  # inside (...)
+    for line in lines:
+        stripped = line.strip()
+        if comment_depth == 0 and variation_depth == 0:
+            if stripped.startswith("%"):
+                continue  # escape line
+            header = HEADER_PATTERN.match(stripped)
+            if header is not None:
+                if in_movetext:
+                    # A new header block without a result token: close the previous game
+                    yield headers, tokens, headers.get("Result", "*")
+                    headers, tokens, in_movetext = {}, [], False
+                headers[header.group(1)] = header.group(2)
+                continue
+        if not stripped:
+            continue
+
+        in_movetext = True
+        word = ""
+        line_comment = False
+        for char in stripped + " ":
+            if comment_depth:
+                if char == "}":
+                    comment_depth = 0
+                continue
+            if char == "{":
+                comment_depth = 1
+            elif char == ";":
+                line_comment = True  # rest of the line is a comment
+            elif char == "(":
+                variation_depth += 1
+            elif char == ")":
+                variation_depth = max(0, variation_depth - 1)
+            elif char.isspace():
+                pass
+            else:
+                if variation_depth == 0:
+                    word += char
+                continue
+            # Any non-word character ends the current word
+            if word:
+                word = MOVE_NUMBER_PATTERN.sub("", word)
+                if word in RESULTS:
+                    yield headers, tokens, word
+                    headers, tokens, in_movetext = {}, [], False
+                elif word and not word.startswith("$"):
+                    tokens.append(word)
+                word = ""
+            if line_comment:
+                break
+    if in_movetext and tokens:
+        yield headers, tokens, headers.get("Result", "*")
+
+
+def replay_game(headers, san_moves):
+    """
+    Generator replaying a game through GameState. Yields (gs, move) before every move is made and finally
+    (gs, None) for the position after the last move. The same GameState object is reused for every step.
+    Raises ValueError on the first move that cannot be played.
+    """
+    if headers.get("SetUp") == "1" and "FEN" in headers:
+        gs = notation.game_state_from_fen(headers["FEN"])
+    else:
+        gs = notation.game_state_from_fen(notation.START_FEN)
+    for san in san_moves:
+        move = notation.parse_san_move(san, gs, gs.get_valid_moves())
+        yield gs, move
+        gs.make_move(move)
+    yield gs, None
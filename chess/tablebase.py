@@ -0,0 +1,468 @@
+"""
+Endgame tablebases for small material sets (KQK, KRK, KPK, KBNK, ...), generated by retrograde analysis with the
+chess_engine move rules and probed by chess_ai for perfect play.
+
+A material set is written white pieces first, e.g. "KRK" is king and rook against a lone king. Positions where the
+pieces have the other colors are probed by mirroring the board. A table stores one byte per position:
+    0      draw (or an illegal position)
+    n > 0  the side to move is mated in n - 1 plies if n - 1 is even, or mates in n - 1 plies if it is odd
+Positions are indexed by side to move, the white king and then the square of every other piece in the order of the
+material name. Symmetry keeps the index small: without pawns the board is rotated or reflected so the white king is
+in the a1-d1-d4 triangle (10 squares), with pawns it is mirrored left to right so the king is on files a-d.
+
+Usage: python -m chess.tablebase [--directory DIR] [--workers N] KQK KRK KPK KBNK
+"""
+import argparse
+import array
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+import warnings
+
+from chess import chess_engine
+
+TABLEBASE_DIRECTORY = os.environ.get("CHESS_TABLEBASES", "tablebases")
+FILE_MAGIC = b"CTB2"
+HEADER_SIZE = 16  # magic + material name padded to 12 bytes
+PIECE_ORDER = "KQRBNP"
+CHUNK_POSITIONS = 4096  # positions handed to a worker at once
+
+# Status of a position found by the generation pass
+ILLEGAL, NORMAL, MATED, STALEMATE = 0, 1, 2, 3
+
+_tables = None  # material name -> Tablebase, loaded on first probe
+
+# White king squares used in the index: the a1-d1-d4 triangle for pawnless tables, files a-d with pawns
+TRIANGLE_SQUARES = {square: slot for slot, square in enumerate(
+    row * 8 + column for row in range(8) for column in range(8) if column <= 3 and 7 - row <= column)}
+HALF_BOARD_SQUARES = {square: slot for slot, square in enumerate(
+    row * 8 + column for row in range(8) for column in range(4))}
+# Square maps of the 8 board symmetries; the first two (identity, left-right mirror) keep pawn directions
+SYMMETRIES = [[new_row * 8 + new_column for new_row, new_column in
+               (transform(row, column) for row in range(8) for column in range(8))]
+              for transform in (lambda r, c: (r, c), lambda r, c: (r, 7 - c), lambda r, c: (7 - r, c),
+                                lambda r, c: (7 - r, 7 - c), lambda r, c: (7 - c, 7 - r), lambda r, c: (7 - c, r),
+                                lambda r, c: (c, 7 - r), lambda r, c: (c, r))]
+
+
+def split_material(material):
+    """
+    Splits "KBNK" into the white and black pieces ("KBN", "K").
+    """
+    if not material.startswith("K") or material.count("K") != 2 or \
+            any(piece not in PIECE_ORDER for piece in material):
+        raise ValueError("Material must look like 'KQK' or 'KBNK': %r" % material)
+    split = material.index("K", 1)
+    return material[:split], material[split:]
+
+
+def _canonical(pieces):
+    return "".join(sorted(pieces, key=PIECE_ORDER.index))
+
+
+def board_material(board):
+    """
+    Returns the (white pieces, black pieces) on board in PIECE_ORDER, e.g. ("KQ", "K").
+    """
+    white = black = ""
+    for board_row in board:
+        for piece in board_row:
+            if piece[0] == "w":
+                white += piece[1]
+            elif piece[0] == "b":
+                black += piece[1]
+    return _canonical(white), _canonical(black)
+
+
+def is_insufficient_material(white, black):
+    """
+    Kings alone, or kings and a single bishop or knight, cannot mate.
+    """
+    extra = (white + black).replace("K", "")
+    return extra in ("", "B", "N")
+
+
+def index_layout(pieces):
+    """
+    Returns (symmetries, white king squares) of the index for a table with these pieces.
+    """
+    if any(piece[1] == "P" for piece in pieces):
+        return SYMMETRIES[:2], HALF_BOARD_SQUARES
+    return SYMMETRIES, TRIANGLE_SQUARES
+
+
+def table_size(pieces):
+    _, king_squares = index_layout(pieces)
+    return 2 * len(king_squares) * 64 ** (len(pieces) - 1)
+
+
+def _position_index(board, white_to_move, pieces, layout, mirrored=False):
+    squares = {}
+    for row in range(8):
+        for column in range(8):
+            piece = board[row][column]
+            if piece != "--":
+                if mirrored:
+                    squares.setdefault(("b" if piece[0] == "w" else "w") + piece[1], []).append((7 - row) * 8 + column)
+                else:
+                    squares.setdefault(piece, []).append(row * 8 + column)
+    symmetries, king_squares = layout
+    king = squares["wK"][0]
+    for symmetry in symmetries:
+        if symmetry[king] in king_squares:
+            break
+    index = (0 if white_to_move != mirrored else 1) * len(king_squares) + king_squares[symmetry[king]]
+    taken = {"wK": 1}
+    for piece in pieces[1:]:
+        count = taken.get(piece, 0)
+        index = index * 64 + symmetry[squares[piece][count]]
+        taken[piece] = count + 1
+    return index
+
+
+class Tablebase:
+    """
+    A memory-mapped table for one material set.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as table_file:
+            self.data = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self.data[:4] != FILE_MAGIC:
+                raise ValueError("Not a current tablebase file: %r" % path)
+            self.material = self.data[4:HEADER_SIZE].rstrip(b"\0").decode("ascii")
+            white, black = split_material(self.material)
+            self.pieces = ["w" + piece for piece in white] + ["b" + piece for piece in black]
+            self.layout = index_layout(self.pieces)
+            if len(self.data) != HEADER_SIZE + table_size(self.pieces):
+                raise ValueError("Tablebase file has the wrong size: %r" % path)
+        except ValueError:
+            self.data.close()
+            raise
+
+    def close(self):
+        self.data.close()
+
+    def index(self, board, white_to_move, mirrored=False):
+        """
+        Index of a position with this material. mirrored means the colors on board are swapped relative to the
+        table, in which case the board is flipped top to bottom.
+        """
+        return _position_index(board, white_to_move, self.pieces, self.layout, mirrored)
+
+    def value(self, index):
+        return self.data[HEADER_SIZE + index]
+
+
+def table_path(material, directory=TABLEBASE_DIRECTORY):
+    return os.path.join(directory, material + ".ctb")
+
+
+def load_tablebases(directory=TABLEBASE_DIRECTORY):
+    """
+    Loads (or reloads) every table in directory for probing.
+    """
+    global _tables
+    _tables = {}
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith(".ctb"):
+                try:
+                    table = Tablebase(os.path.join(directory, name))
+                except ValueError as error:
+                    # e.g. a table written by an older version, python -m chess.tablebase generates it again
+                    warnings.warn("Skipping tablebase: %s" % error)
+                    continue
+                _tables[table.material] = table
+    return _tables
+
+
+def loaded_materials():
+    """
+    Returns the sorted material names of the loaded tables, loading them first if needed.
+    """
+    if _tables is None:
+        load_tablebases()
+    return sorted(_tables)
+
+
+def probe_board(board, white_to_move):
+    """
+    Returns the table value (see the module docstring) of a position, 0 for a dead draw by insufficient
+    material, or None if no loaded table covers it.
+    """
+    if _tables is None:
+        load_tablebases()
+    if not _tables:
+        return None
+    white, black = board_material(board)
+    if is_insufficient_material(white, black):
+        return 0
+    table = _tables.get(white + black)
+    if table is not None:
+        return table.value(table.index(board, white_to_move))
+    table = _tables.get(black + white)
+    if table is not None:
+        return table.value(table.index(board, white_to_move, mirrored=True))
+    return None
+
+
+def probe(gs):
+    return probe_board(gs.board, gs.white_to_move)
+
+
+# --- Generation ---
+
+_worker_state = None  # (table pieces, index layout, GameState) of a generation worker
+SPILL_HEADER = struct.Struct("<QII")  # chunk start, positions, successors
+
+
+def _init_worker(material, directory):
+    global _worker_state
+    white, black = split_material(material)
+    pieces = ["w" + piece for piece in white] + ["b" + piece for piece in black]
+    load_tablebases(directory)
+    _worker_state = (pieces, index_layout(pieces), chess_engine.GameState())
+
+
+def _setup(gs, pieces, squares, white_to_move):
+    """
+    Puts the pieces on an empty board of gs. Returns False if the placement is not a legal position.
+    """
+    board = [["--"] * 8 for _ in range(8)]
+    for piece, square in zip(pieces, squares):
+        row, column = divmod(square, 8)
+        if board[row][column] != "--":
+            return False
+        if piece[1] == "P" and row in (0, 7):
+            return False
+        board[row][column] = piece
+    gs.set_position(board, white_to_move)
+    white_row, white_column = gs.white_king_location
+    black_row, black_column = gs.black_king_location
+    if abs(white_row - black_row) <= 1 and abs(white_column - black_column) <= 1:
+        return False
+    # The side that just moved cannot be left in check
+    gs.white_to_move = not white_to_move
+    in_check = gs.in_check()
+    gs.white_to_move = white_to_move
+    return not in_check
+
+
+def _generate_chunk(bounds):
+    """
+    Worker: finds the status, move count, in-table successors and out-of-table results of positions start..end-1.
+    """
+    start, end = bounds
+    pieces, layout, gs = _worker_state
+    king_squares = list(layout[1])
+    statuses = bytearray(end - start)
+    move_counts = array.array("H", bytes(2 * (end - start)))
+    table_moves = array.array("H", bytes(2 * (end - start)))  # moves staying in the table
+    successors = array.array("I")
+    exits = []  # (position index, table value of the position after the move)
+    for index in range(start, end):
+        squares = []
+        rest = index
+        for _ in pieces[1:]:
+            rest, square = divmod(rest, 64)
+            squares.append(square)
+        rest, king_slot = divmod(rest, len(king_squares))
+        squares.append(king_squares[king_slot])
+        squares.reverse()
+        if not _setup(gs, pieces, squares, rest == 0):
+            continue
+        moves = gs.get_valid_moves()
+        if not moves:
+            statuses[index - start] = MATED if gs.checkmate else STALEMATE
+            continue
+        statuses[index - start] = NORMAL
+        move_counts[index - start] = len(moves)
+        for move in moves:
+            gs.make_move(move)
+            if move.piece_captured == "--" and not move.is_pawn_promotion:
+                successors.append(_position_index(gs.board, gs.white_to_move, pieces, layout))
+                table_moves[index - start] += 1
+            else:
+                exits.append((index, probe_board(gs.board, gs.white_to_move) or 0))
+            gs.undo_move()
+    return start, bytes(statuses), move_counts, table_moves, successors, exits
+
+
+def generate_tablebase(material, directory=TABLEBASE_DIRECTORY, workers=None):
+    """
+    Generates the table for material and writes it to directory. Tables the material can convert into (e.g. KQK
+    for KPK) must already be in directory, otherwise those conversions count as draws.
+    """
+    white, black = split_material(material)
+    pieces = ["w" + piece for piece in white] + ["b" + piece for piece in black]
+    size = table_size(pieces)
+    chunks = [(start, min(start + CHUNK_POSITIONS, size)) for start in range(0, size, CHUNK_POSITIONS)]
+    os.makedirs(directory, exist_ok=True)
+    path = table_path(material, directory)
+    spill_path = path + ".successors"
+
+    # Generation pass: move generation is the expensive part, run it on every core. Successor lists are spilled to
+    # disk as they arrive and only their predecessor counts are kept in memory.
+    statuses = bytearray(size)
+    remaining = array.array("H", bytes(2 * size))  # moves not yet known to lose, per position
+    predecessor_ends = array.array("I", bytes(4 * (size + 1)))
+    exit_wins = {}  # ply -> positions that win at that ply by leaving the table
+    exit_losses = {}  # ply -> positions with a move leaving the table that loses at the next ply
+    with multiprocessing.Pool(workers, _init_worker, (material, directory)) as pool, \
+            open(spill_path, "wb") as spill:
+        for start, chunk_statuses, move_counts, table_moves, successors, exits in \
+                pool.imap(_generate_chunk, chunks):
+            statuses[start:start + len(chunk_statuses)] = chunk_statuses
+            remaining[start:start + len(move_counts)] = move_counts
+            spill.write(SPILL_HEADER.pack(start, len(table_moves), len(successors)))
+            table_moves.tofile(spill)
+            successors.tofile(spill)
+            for successor in successors:
+                predecessor_ends[successor] += 1
+            for index, value in exits:
+                if value:
+                    plies = value - 1
+                    if plies % 2 == 0:
+                        # The opponent is mated in plies after this move
+                        exit_wins.setdefault(plies + 1, []).append(index)
+                    else:
+                        # The opponent mates in plies after this move
+                        exit_losses.setdefault(plies, []).append(index)
+
+    # Invert the successor lists into predecessor lists (one flat array, the predecessors of position i are
+    # predecessors[offsets[i]:offsets[i + 1]]). The counts become end offsets, and filling each list from its end
+    # turns them into start offsets, so one chunk of successors at a time is read back from disk.
+    for index in range(1, size + 1):
+        predecessor_ends[index] += predecessor_ends[index - 1]
+    predecessors = array.array("I", bytes(4 * predecessor_ends[size]))
+    with open(spill_path, "rb") as spill:
+        while True:
+            header = spill.read(SPILL_HEADER.size)
+            if not header:
+                break
+            start, position_count, successor_count = SPILL_HEADER.unpack(header)
+            table_moves = array.array("H")
+            table_moves.fromfile(spill, position_count)
+            successors = array.array("I")
+            successors.fromfile(spill, successor_count)
+            position = 0
+            for offset, move_count in enumerate(table_moves):
+                for successor in successors[position:position + move_count]:
+                    predecessor_ends[successor] -= 1
+                    predecessors[predecessor_ends[successor]] = start + offset
+                position += move_count
+    os.remove(spill_path)
+    offsets = predecessor_ends
+
+    # Retrograde pass, one ply at a time: mated positions are lost at ply 0, their predecessors are won at ply 1,
+    # positions whose every move leads to a won position are lost at the ply after the last of those, ...
+    values = bytearray(size)
+    frontier = [index for index in range(size) if statuses[index] == MATED]
+    for index in frontier:
+        values[index] = 1
+    last_event = max(list(exit_wins) + list(exit_losses) + [0])
+    plies = 0
+    while frontier or plies <= last_event:
+        if plies + 2 > 255:
+            raise ValueError("Distance to mate does not fit in a byte for %s" % material)
+        next_frontier = []
+        if plies % 2 == 0:
+            for index in frontier:
+                for predecessor in predecessors[offsets[index]:offsets[index + 1]]:
+                    if values[predecessor] == 0:
+                        values[predecessor] = plies + 2
+                        next_frontier.append(predecessor)
+        else:
+            for index in frontier:
+                for predecessor in predecessors[offsets[index]:offsets[index + 1]]:
+                    _lose_one_move(predecessor, plies, values, remaining, next_frontier)
+        for index in exit_losses.get(plies, ()):
+            _lose_one_move(index, plies, values, remaining, next_frontier)
+        plies += 1
+        for index in exit_wins.get(plies, ()):
+            if values[index] == 0:
+                values[index] = plies + 1
+                next_frontier.append(index)
+        frontier = next_frontier
+
+    with open(path + ".tmp", "wb") as table_file:
+        table_file.write(FILE_MAGIC + material.encode("ascii").ljust(HEADER_SIZE - len(FILE_MAGIC), b"\0"))
+        table_file.write(values)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def _lose_one_move(index, plies, values, remaining, frontier):
+    """
+    One more move of position index is known to lose (the opponent mates within plies); once every move loses,
+    the position is lost at the next ply.
+    """
+    if values[index] == 0 and remaining[index] > 0:
+        remaining[index] -= 1
+        if remaining[index] == 0:
+            values[index] = plies + 2
+            frontier.append(index)
+
+
+def required_tables(material):
+    """
+    Returns the tables material depends on (pawn promotions) followed by material itself, in generation order.
+    """
+    white, black = split_material(material)
+    order = []
+    for side, other, is_white in ((white, black, True), (black, white, False)):
+        if "P" in side:
+            promoted = _canonical(side.replace("P", "Q", 1))
+            dependency = promoted + other if is_white else other + promoted
+            for table in required_tables(dependency):
+                if table not in order:
+                    order.append(table)
+    order.append(white + black)
+    return order
+
+
+def _table_is_current(material, directory):
+    """
+    True if the table for material exists and loads: not truncated and not written by an older version.
+    """
+    try:
+        table = Tablebase(table_path(material, directory))
+    except (OSError, ValueError):
+        return False
+    table.close()
+    return table.material == material
+
+
+def generate_tablebases(materials, directory=TABLEBASE_DIRECTORY, workers=None):
+    """
+    Generates the tables for materials and the tables they depend on, skipping tables that already exist and load.
+    Missing, truncated or outdated tables are (re)generated.
+    """
+    generated = []
+    for material in materials:
+        for table in required_tables(material):
+            if table in generated or _table_is_current(table, directory):
+                continue
+            start = time.perf_counter()
+            generate_tablebase(table, directory, workers)
+            print("%s generated in %.1fs" % (table, time.perf_counter() - start))
+            generated.append(table)
+    load_tablebases(directory)
+    return generated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases.")
+    parser.add_argument("materials", nargs="+", help="material sets such as KQK KRK KPK KBNK")
+    parser.add_argument("--directory", default=TABLEBASE_DIRECTORY)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    generate_tablebases(args.materials, args.directory, args.workers)
+
+
+if __name__ == '__main__':
+    main()
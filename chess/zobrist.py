@@ -0,0 +1,53 @@
+"""
+Zobrist hashing: a 64-bit key for a position, built by xor-ing a fixed random number for every piece on its square,
+the side to move, each castling right and the en passant file. The keys come from a fixed seed so hashes are stable
+between processes and can be stored on disk.
+"""
+import random
+
+PIECES = ["wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK"]
+
+_random = random.Random(0x5EED)
+PIECE_SQUARE_KEYS = {piece: [_random.getrandbits(64) for _ in range(64)] for piece in PIECES}
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)
+CASTLING_KEYS = [_random.getrandbits(64) for _ in range(4)]  # wks, wqs, bks, bqs
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]  # one per file
+# Combined key of every castling rights bit set (bit i of the index is CASTLING_KEYS[i])
+CASTLING_RIGHTS_KEYS = [0] * 16
+for _rights in range(16):
+    for _bit in range(4):
+        if _rights & (1 << _bit):
+            CASTLING_RIGHTS_KEYS[_rights] ^= CASTLING_KEYS[_bit]
+
+
+def hash_position(gs):
+    """
+    Computes the hash of the current position of gs from scratch. GameState keeps this up to date incrementally
+    in gs.zobrist_key, this is for setting it up.
+    """
+    key = 0
+    for row in range(8):
+        for column in range(8):
+            piece = gs.board[row][column]
+            if piece != "--":
+                key ^= PIECE_SQUARE_KEYS[piece][row * 8 + column]
+    if not gs.white_to_move:
+        key ^= BLACK_TO_MOVE_KEY
+    key ^= CASTLING_RIGHTS_KEYS[gs.castling_rights]
+    return key ^ en_passant_key(gs.board, gs.en_passant_possible, gs.white_to_move)
+
+
+def en_passant_key(board, en_passant_possible, white_to_move):
+    """
+    Key of the en passant file, or 0 if no pawn of the side to move stands next to the pawn that can be captured.
+    Without such a pawn the position is the same as one without an en passant square and must hash the same.
+    """
+    if en_passant_possible == ():
+        return 0
+    row, column = en_passant_possible
+    pawn, pawn_row = ("wP", row + 1) if white_to_move else ("bP", row - 1)
+    if 0 <= pawn_row <= 7:
+        for pawn_column in (column - 1, column + 1):
+            if 0 <= pawn_column <= 7 and board[pawn_row][pawn_column] == pawn:
+                return EN_PASSANT_KEYS[column]
+    return 0
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from chess import analysis_cache
+
+
+class AnalysisCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.db")
+        self.cache = analysis_cache.AnalysisCache(self.path)
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_hit_only_at_equal_or_greater_depth(self):
+        self.cache.store(1, "e2e4", 30, 3, "p")
+        self.assertEqual(self.cache.lookup(1, 2, "p"), ("e2e4", 30, 3))
+        self.assertEqual(self.cache.lookup(1, 3, "p"), ("e2e4", 30, 3))
+        self.assertIsNone(self.cache.lookup(1, 4, "p"))
+        self.assertIsNone(self.cache.lookup(1, 3, "other params"))
+        self.assertIsNone(self.cache.lookup(2, 1, "p"))
+
+    def test_large_hashes(self):
+        self.cache.store(2 ** 64 - 1, "d2d4", -5, 1)
+        self.assertEqual(self.cache.lookup(2 ** 64 - 1, 1), ("d2d4", -5, 1))
+
+    def test_store_keeps_deeper_entry(self):
+        self.cache.store(1, "e2e4", 30, 4)
+        self.cache.store(1, "d2d4", 10, 2)
+        self.assertEqual(self.cache.lookup(1, 1), ("e2e4", 30, 4))
+        self.cache.store(1, "c2c4", 20, 5)
+        self.assertEqual(self.cache.lookup(1, 1), ("c2c4", 20, 5))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.max_entries = 3
+        for position_hash in range(4):
+            self.cache.store(position_hash, "e2e4", 0, 1)
+        self.cache.lookup(0, 1)  # 0 is now used more recently than 1
+        self.cache.flush()
+        self.cache.evict()
+        self.assertIsNone(self.cache.lookup(1, 1))
+        for position_hash in (0, 2, 3):
+            self.assertIsNotNone(self.cache.lookup(position_hash, 1))
+        self.assertEqual(self.cache.stats()["entries"], 3)
+
+    def test_counters_add_up_across_connections(self):
+        self.cache.store(1, "e2e4", 0, 1)
+        with analysis_cache.AnalysisCache(self.path) as other:
+            other.lookup(1, 1)
+            other.lookup(2, 1)
+            other.lookup(3, 1)
+        self.cache.lookup(1, 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 0))
+        self.assertEqual((stats["total_hits"], stats["total_misses"]), (2, 2))
+        self.assertEqual(stats["total_hit_rate"], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
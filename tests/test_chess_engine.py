@@ -0,0 +1,44 @@
+import random
+import unittest
+
+from chess import notation
+from chess import zobrist
+
+
+def snapshot(gs):
+    return ([row[:] for row in gs.board], gs.white_to_move, gs.castling_rights, gs.en_passant_possible,
+            gs.halfmove_clock, gs.white_king_location, gs.black_king_location, gs.zobrist_key)
+
+
+class MakeUndoTest(unittest.TestCase):
+    def play_random_games(self, fen, games=20, plies=80):
+        generator = random.Random(1)
+        for _ in range(games):
+            gs = notation.game_state_from_fen(fen)
+            history = []
+            for _ in range(plies):
+                moves = gs.get_valid_moves()
+                if not moves:
+                    break
+                history.append(snapshot(gs))
+                gs.make_move(generator.choice(moves))
+                self.assertEqual(gs.zobrist_key, zobrist.hash_position(gs))
+            while history:
+                gs.undo_move()
+                self.assertEqual(snapshot(gs), history.pop())
+
+    def test_round_trip_from_start(self):
+        self.play_random_games(notation.START_FEN)
+
+    def test_round_trip_with_castling_and_en_passant(self):
+        self.play_random_games("r3k2r/pppq1ppp/2n5/3pP3/8/2N5/PPPQ1PPP/R3K2R w KQkq d6 0 1")
+
+    def test_castling_right_without_rook_is_dropped(self):
+        gs = notation.game_state_from_fen("4k3/8/8/8/8/8/8/4K3 w K - 0 1")
+        self.assertEqual(gs.castling_rights, 0)
+        self.assertEqual(len(gs.get_valid_moves()), 5)
+        self.play_random_games("4k3/8/8/8/8/8/8/4K3 w K - 0 1", games=5, plies=20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from chess import notation
+from chess import zobrist
+
+
+class FenTest(unittest.TestCase):
+    def test_round_trip(self):
+        for fen in (notation.START_FEN, "r3k2r/pppq1ppp/2n5/3pP3/8/2N5/PPPQ1PPP/R3K2R w KQkq d6 0 1",
+                    "4k3/8/8/8/3Pp3/8/8/4K3 b - d3 7 1"):
+            self.assertEqual(notation.to_fen(notation.game_state_from_fen(fen)), fen)
+
+    def test_en_passant_square_without_capturable_pawn_is_rejected(self):
+        for fen in ("4k3/8/8/8/8/3P4/8/4K3 w - e4 0 1",  # wrong rank, no pawn
+                    "4k3/8/8/3pP3/8/8/8/4K3 b - d6 0 1",  # wrong side to move
+                    "4k3/8/3p4/3pP3/8/8/8/4K3 w - d6 0 1",  # square not empty
+                    "4k3/8/8/4P3/8/8/8/4K3 w - d6 0 1"):  # no pawn in front
+            with self.assertRaises(ValueError):
+                notation.game_state_from_fen(fen)
+
+    def test_halfmove_clock_out_of_range_is_rejected(self):
+        with self.assertRaises(ValueError):
+            notation.game_state_from_fen("4k3/8/8/8/8/8/8/4K2R w - - 999999999999999 1")
+        gs = notation.game_state_from_fen("4k3/8/8/8/8/8/8/4K2R w - - 65535 1")
+        gs.make_move(gs.get_valid_moves()[0])
+        gs.undo_move()
+        self.assertEqual(gs.halfmove_clock, 65535)
+
+    def test_en_passant_capture(self):
+        gs = notation.game_state_from_fen("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1")
+        move = notation.parse_coordinate_move("e5d6", gs.get_valid_moves())
+        self.assertTrue(move.is_en_passant_move)
+        gs.make_move(move)
+        self.assertEqual(notation.to_fen(gs), "4k3/8/3P4/8/8/8/8/4K3 b - - 0 1")
+        self.assertEqual(gs.zobrist_key, zobrist.hash_position(gs))
+        gs.undo_move()
+        self.assertEqual(notation.to_fen(gs), "4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1")
+
+
+class SanTest(unittest.TestCase):
+    def parse(self, fen, san):
+        gs = notation.game_state_from_fen(fen)
+        return notation.parse_san_move(san, gs, gs.get_valid_moves()).get_chess_notation()
+
+    def test_pawn_and_piece_moves(self):
+        self.assertEqual(self.parse(notation.START_FEN, "e4"), "e2e4")
+        self.assertEqual(self.parse(notation.START_FEN, "Nf3+"), "g1f3")
+
+    def test_castling(self):
+        fen = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
+        self.assertEqual(self.parse(fen, "O-O"), "e1g1")
+        self.assertEqual(self.parse(fen, "0-0-0"), "e1c1")
+        self.assertEqual(self.parse(fen.replace(" w ", " b "), "O-O-O"), "e8c8")
+
+    def test_en_passant(self):
+        self.assertEqual(self.parse("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1", "exd6"), "e5d6")
+
+    def test_promotion(self):
+        fen = "3r3k/4P3/8/8/8/8/8/4K3 w - - 0 1"
+        self.assertEqual(self.parse(fen, "e8=Q+"), "e7e8")
+        self.assertEqual(self.parse(fen, "exd8Q"), "e7d8")
+        with self.assertRaises(ValueError):
+            self.parse(fen, "e8=N")
+
+    def test_ambiguous_move_needs_disambiguation(self):
+        fen = "4k3/8/8/8/8/8/4K3/R6R w - - 0 1"
+        with self.assertRaises(ValueError):
+            self.parse(fen, "Rf1")
+        self.assertEqual(self.parse(fen, "Raf1"), "a1f1")
+        self.assertEqual(self.parse(fen, "Rhf1"), "h1f1")
+        fen = "4k3/8/8/8/8/N7/8/N3K3 w - - 0 1"
+        self.assertEqual(self.parse(fen, "N1b3"), "a1b3")
+        self.assertEqual(self.parse(fen, "N3c2"), "a3c2")
+
+    def test_illegal_and_invalid_moves(self):
+        for san in ("e5", "Ke3", "xyz"):
+            with self.assertRaises(ValueError):
+                self.parse(notation.START_FEN, san)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from chess import notation
+from chess import pgn
+
+
+def read(text):
+    return list(pgn.read_games(text.splitlines(True)))
+
+
+class ReadGamesTest(unittest.TestCase):
+    def test_headers_moves_and_result(self):
+        games = read('[Event "Test"]\n[White "A"]\n\n1. e4 e5 2. Nf3 Nc6 1-0\n')
+        self.assertEqual(games, [({"Event": "Test", "White": "A"}, ["e4", "e5", "Nf3", "Nc6"], "1-0")])
+
+    def test_comments_are_dropped(self):
+        games = read('1. e4 {best by test} e5 {a comment\nover two lines} 2. Nf3 ; rest of the line ignored Nc3\n'
+                     'Nc6 1/2-1/2\n')
+        self.assertEqual(games[0][1:], (["e4", "e5", "Nf3", "Nc6"], "1/2-1/2"))
+
+    def test_nested_variations_and_nags_are_dropped(self):
+        games = read("1. e4 $1 e5 (1... c5 2. Nf3 (2. c3 d5) d6) 2. Nf3! Nc6 (2... d6 {Philidor}) 0-1\n")
+        self.assertEqual(games[0][1:], (["e4", "e5", "Nf3!", "Nc6"], "0-1"))
+
+    def test_move_numbers_without_space(self):
+        games = read("1.e4 e5 2.Nf3 2...Nc6 *\n")
+        self.assertEqual(games[0][1:], (["e4", "e5", "Nf3", "Nc6"], "*"))
+
+    def test_missing_result_token(self):
+        games = read('[Result "1-0"]\n\n1. e4 e5\n\n[Event "Second"]\n\n1. d4 d5\n')
+        self.assertEqual(games, [({"Result": "1-0"}, ["e4", "e5"], "1-0"), ({"Event": "Second"}, ["d4", "d5"], "*")])
+
+    def test_several_games(self):
+        games = read("1. e4 1-0\n\n1. d4 0-1\n\n1. c4 *\n")
+        self.assertEqual([(moves, result) for _, moves, result in games],
+                         [(["e4"], "1-0"), (["d4"], "0-1"), (["c4"], "*")])
+
+
+class ReplayGameTest(unittest.TestCase):
+    def test_replay_yields_every_position(self):
+        steps = [(notation.to_fen(gs), move and move.get_chess_notation())
+                 for gs, move in pgn.replay_game({}, ["e4", "e5", "Nf3"])]
+        self.assertEqual([move for _, move in steps], ["e2e4", "e7e5", "g1f3", None])
+        self.assertEqual(steps[0][0], notation.START_FEN)
+        self.assertEqual(steps[-1][0], "rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 1")
+
+    def test_replay_from_fen_header(self):
+        headers = {"SetUp": "1", "FEN": "4k3/8/8/8/8/8/8/4K2R w K - 0 1"}
+        *_, (gs, move) = pgn.replay_game(headers, ["O-O", "Kd7"])
+        self.assertEqual(notation.to_fen(gs), "8/3k4/8/8/8/8/8/5RK1 w - - 2 1")
+
+    def test_illegal_move_raises(self):
+        with self.assertRaises(ValueError):
+            list(pgn.replay_game({}, ["e4", "e4"]))
+
+
+if __name__ == '__main__':
+    unittest.main()